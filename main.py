@@ -12,6 +12,7 @@ import crontab
 
 import bash
 import static_ip
+import zone_monitor
 
 # import pi_baseclient.bash as bash
 # import pi_baseclient.static_ip as static_ip
@@ -22,6 +23,7 @@ FW_LOG = "/etc/dns-fw/log"
 FW_CONF = "/etc/dns-fw/fw.conf.json"
 FW_IS_INSTALLED = "/etc/dns-fw/installed"
 CUSTOM_NAMED_CONF = "/etc/dns-fw/named.conf"
+RECURSIVE_NAMED_CONF = "/etc/dns-fw/named.conf.recursive"
 
 BIND_DIR = "/etc/bind/"
 NAMED_CONF = "/etc/bind/named.conf"
@@ -47,6 +49,9 @@ MASTER_ZONE_TEMPLATE = "resources/master_zone_template"
 SERVER_TEMPLATE = "resources/server_template"
 RPZ_HEADER_TEMPLATE = "resources/rpz_header_template"
 
+RPZ_MASTER = "129.187.208.46"
+ZONE_LOAD_TIMEOUT = 300
+
 LOGO = '''\033[33m
   (         )  (         (     (    (         (  (       (      (     (     
   )\ )   ( /(  )\ )      )\ )  )\ ) )\ )      )\))(   '  )\     )\ )  )\ )  
@@ -65,6 +70,7 @@ class Configuration:
         self.forward_over_tls: bool
         self.block_zones: list
         self.whitelist_domains: list
+        self.critical_zones: list
         if filename is not None:
             with open(filename) as file:
                 configuration = json.load(file)
@@ -72,16 +78,26 @@ class Configuration:
             self.forward_over_tls = configuration["forward_over_tls"]
             self.block_zones = configuration["block_zones"]
             self.whitelist_domains = configuration["whitelist_domains"]
+            self.critical_zones = configuration.get("critical_zones", [])
 
 
 def main() -> None:
     """Entry point used if script is called directly."""
     parser = argparse.ArgumentParser(prog="dns-firewall", description="DNS-Firewall for filtering DNS-Queries")
     parser.add_argument("action", default="start",
-                        help="One of 'start', 'stop', 'reconfigure' or 'remove'; default is 'start'")
+                        help="One of 'start', 'stop', 'reconfigure', 'remove', 'status', 'metrics' or 'check'; "
+                             "default is 'start'")
     args = parser.parse_args()
+    if args.action in ["status", "metrics"]:
+        status(metrics=args.action == "metrics")
+        return
+    if args.action == "check":
+        configure_logs(interactive=False)
+        check()
+        return
     print(LOGO)
     configure_logs(interactive=True)
+    logging.info("DNS-FIREWALL started.")
     if args.action == "start":
         if not os.path.isfile(FW_IS_INSTALLED):
             logging.warning("Software is not installed.")
@@ -103,6 +119,7 @@ def run() -> None:
     signal.signal(signal.SIGTERM, _sigterm_handler)
     make_directories()
     configure_logs(interactive=False)
+    logging.info("DNS-FIREWALL started.")
     if not os.path.isfile(FW_IS_INSTALLED):
         configure()
     load()
@@ -142,7 +159,6 @@ def configure_logs(interactive: bool = False) -> None:
             level=logging.INFO,
             style="{"
         )
-    logging.info("DNS-FIREWALL started.")
 
 
 def configure(install_packages=False, interactive=False) -> None:
@@ -261,6 +277,10 @@ def configure(install_packages=False, interactive=False) -> None:
             python_path = bash.call("which python3").strip()
             job = cron.new(command="{0} {1} start".format(python_path, own_path), comment="DNS-Firewall")
             job.every_reboot()
+            check_job = cron.new(command="cd {0} && {1} {2} check".format(os.path.dirname(own_path), python_path,
+                                                                          own_path),
+                                 comment="DNS-Firewall zone check")
+            check_job.minute.on(0)
             cron.write()
 
     logging.info(
@@ -280,25 +300,13 @@ def load() -> None:
     with open(SLAVE_ZONE_TEMPLATE) as file:
         zone_template = file.read()
 
-    with open(KNOWN_FORWARDERS) as file:
-        known_forwarders = json.load(file)
-
-    zone_names = []
-    combination_number = 0
-    for entry in configuration.block_zones:
-        if entry in known_forwarders:
-            combination_number = combination_number + 2 ** known_forwarders[entry]
-        elif entry == "ip":
-            zone_names.append("db.ip")
-        else:
-            zone_names.append(entry)
-
-    if combination_number > 0:
-        zone_names.append("db.combination.{0}".format(combination_number))
+    zone_names, critical_zone_names = slave_zone_names(configuration)
 
     policies = " ".join(list(map(lambda x: 'zone "{0}";'.format(x), zone_names)))
     slave_zones = "".join(
-        list(map(lambda x: zone_template.replace("{NAME}", x).replace("{FILE}", NAMED_CACHE_DIR + x),
+        list(map(lambda x: zone_template.replace("{NAME}", x)
+                 .replace("{MASTER}", RPZ_MASTER)
+                 .replace("{FILE}", NAMED_CACHE_DIR + x),
                  zone_names)))
 
     # WHITELIST DB.PASSTHRU
@@ -369,22 +377,25 @@ def load() -> None:
         .replace("{SLAVE_ZONES}", slave_zones) \
         .replace("{SERVER}", server)
 
-    with open(NAMED_CONF, "w") as file:
+    # HOLD BACK RECURSION UNTIL CRITICAL ZONES ARE LOADED
+    # While critical zones are configured, named.conf on disk always has recursion disabled, so BIND9 never
+    # recurses after a reboot before the critical zones are confirmed to be loaded by start or check.
+    with open(RECURSIVE_NAMED_CONF, "w") as file:
         file.write(custom_named_conf)
 
-    # CHECK CONFIGURATION
-    logging.info("Checking BIND9 configuration.")
-    try:
-        output = bash.call("sudo named-checkconf")
-        if output != "":
-            logging.critical("BIND9 config is corrupted:\n"
-                             "{0}\n"
-                             "Aborting now.".format(output))
-            exit(-1)
-    except bash.CallError as error:
-        logging.critical("Error thrown while checking BIND9 config:\n"
-                         "{0}\n"
-                         "Aborting now.".format(error))
+    if len(critical_zone_names) > 0:
+        gated_named_conf = gate_recursion(custom_named_conf)
+        critical_zones_loaded = all(status.loaded for status in zone_monitor.check(critical_zone_names))
+        if critical_zones_loaded:
+            write_named_conf(custom_named_conf)
+        else:
+            logging.info("Disabling recursion until critical zones are loaded: {0}".format(
+                ", ".join(critical_zone_names)))
+            write_named_conf(gated_named_conf)
+    else:
+        critical_zones_loaded = True
+        gated_named_conf = None
+        write_named_conf(custom_named_conf)
 
     # Reload BIND9
     logging.info("Reloading BIND9 / stunnel for changes to take effect.")
@@ -396,10 +407,137 @@ def load() -> None:
         bash.call("sudo rndc reload")
     except bash.CallError as error:
         logging.critical("Critical error restarting: {0}\nAborting now.".format(error))
+        if gated_named_conf is not None:
+            persist_named_conf(gated_named_conf)
+        if not critical_zones_loaded:
+            stop_bind("Recursion could not be disabled, stopping BIND9 to prevent unfiltered answers.")
         exit(-1)
 
     logging.info("Reload successful.")
 
+    # WAIT FOR CRITICAL ZONES
+    if gated_named_conf is not None:
+        if critical_zones_loaded:
+            persist_named_conf(gated_named_conf)
+        else:
+            logging.info("Waiting for critical zones to be loaded: {0}".format(", ".join(critical_zone_names)))
+            if zone_monitor.wait_until_loaded(critical_zone_names, ZONE_LOAD_TIMEOUT):
+                enable_recursion()
+            else:
+                logging.error("Critical zones could not be loaded, recursion stays disabled. "
+                              "The hourly check enables it as soon as they are loaded.")
+
+    zone_monitor.alert(zone_monitor.check(zone_names, RPZ_MASTER))
+
+
+def gate_recursion(named_conf: str) -> str:
+    """Returns the BIND9 configuration with recursion disabled, aborts if it can't be disabled."""
+    gated_named_conf = named_conf.replace("recursion yes;", "recursion no;")
+    if gated_named_conf == named_conf:
+        logging.critical("BIND9 config contains no 'recursion yes;', recursion can't be held back "
+                         "until critical zones are loaded.\n"
+                         "Aborting now.")
+        exit(-1)
+    return gated_named_conf
+
+
+def enable_recursion() -> None:
+    """Applies the BIND9 configuration with recursion enabled, but keeps it disabled on disk for the next boot."""
+    logging.info("Critical zones loaded, enabling recursion.")
+    with open(RECURSIVE_NAMED_CONF) as file:
+        named_conf = file.read()
+
+    write_named_conf(named_conf)
+    try:
+        bash.call("sudo rndc reconfig")
+    except bash.CallError as error:
+        logging.critical("Critical error reconfiguring: {0}\nAborting now.".format(error))
+        exit(-1)
+    finally:
+        persist_named_conf(gate_recursion(named_conf))
+
+
+def disable_recursion() -> None:
+    """Applies the BIND9 configuration with recursion disabled."""
+    logging.warning("Critical zones not loaded, disabling recursion.")
+    with open(RECURSIVE_NAMED_CONF) as file:
+        named_conf = file.read()
+
+    write_named_conf(gate_recursion(named_conf))
+    try:
+        bash.call("sudo rndc reconfig")
+    except bash.CallError as error:
+        logging.critical("Critical error reconfiguring: {0}\nAborting now.".format(error))
+        stop_bind("Recursion could not be disabled, stopping BIND9 to prevent unfiltered answers.")
+        exit(-1)
+
+
+def persist_named_conf(named_conf: str) -> None:
+    """Writes the BIND9 configuration used on the next start without applying it."""
+    with open(NAMED_CONF, "w") as file:
+        file.write(named_conf)
+
+
+def stop_bind(reason: str) -> None:
+    """Stops BIND9 as last resort to prevent unfiltered answers."""
+    logging.critical(reason)
+    try:
+        bash.call("sudo systemctl stop bind9")
+    except bash.CallError as error:
+        logging.critical("Critical error stopping BIND9: {0}".format(error))
+
+
+def write_named_conf(named_conf: str) -> None:
+    """Writes the BIND9 configuration and checks it, aborts if it is corrupted."""
+    with open(NAMED_CONF, "w") as file:
+        file.write(named_conf)
+
+    logging.info("Checking BIND9 configuration.")
+    try:
+        output = bash.call("sudo named-checkconf")
+        if output != "":
+            logging.critical("BIND9 config is corrupted:\n"
+                             "{0}\n"
+                             "Aborting now.".format(output))
+            exit(-1)
+    except bash.CallError as error:
+        logging.critical("Error thrown while checking BIND9 config:\n"
+                         "{0}\n"
+                         "Aborting now.".format(error))
+
+
+def slave_zone_names(configuration: Configuration) -> tuple:
+    """Returns the names of all slave blocking zones and of those among them which are critical."""
+    with open(BLOCK_CATEGORIES) as file:
+        block_categories = json.load(file)
+
+    return zone_monitor.slave_zone_names(configuration.block_zones, configuration.critical_zones, block_categories)
+
+
+def status(metrics=False) -> None:
+    """Prints freshness of all slave blocking zones, either as JSON or as Prometheus metrics."""
+    configuration = Configuration(filename=FW_CONF)
+    zone_names, _ = slave_zone_names(configuration)
+    statuses = zone_monitor.check(zone_names, RPZ_MASTER)
+    print(zone_monitor.to_metrics(statuses) if metrics else zone_monitor.to_json(statuses))
+
+
+def check() -> None:
+    """Logs all slave blocking zones which are not loaded or stale and enables recursion only while all critical
+    zones are loaded, called periodically by cron."""
+    configuration = Configuration(filename=FW_CONF)
+    zone_names, critical_zone_names = slave_zone_names(configuration)
+    statuses = zone_monitor.check(zone_names, RPZ_MASTER)
+    zone_monitor.alert(statuses)
+
+    if len(critical_zone_names) > 0 and os.path.isfile(RECURSIVE_NAMED_CONF):
+        critical_zones_loaded = all(status.loaded for status in statuses if status.name in critical_zone_names)
+        recursion_available = zone_monitor.recursion_available()
+        if critical_zones_loaded and recursion_available is False:
+            enable_recursion()
+        elif not critical_zones_loaded and recursion_available is not False:
+            disable_recursion()
+
 
 def stop() -> None:
     """Stops the running services"""
@@ -419,6 +557,7 @@ def remove(remove_packages=False, interactive=False) -> None:
     # REMOVE CRON JOB
     cron = crontab.CronTab(user="root")
     cron.remove_all(comment="DNS-Firewall")
+    cron.remove_all(comment="DNS-Firewall zone check")
 
     # REMOVE DIR
     logging.info("Removing application directory {0}.".format(FW_DIR))
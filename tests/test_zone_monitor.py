@@ -0,0 +1,274 @@
+import datetime
+import unittest
+import unittest.mock
+
+import bash
+import zone_monitor
+
+NEVER_LOADED = '''\
+name: db.ip
+type: secondary
+files: /var/cache/named/db.ip
+serial: 0
+nodes: 0
+last loaded: Thu, 01 Jan 1970 00:00:00 GMT
+next refresh: Mon, 19 Oct 2026 10:05:00 GMT
+secure: no
+dynamic: no
+reconfigurable via modzone: no
+'''
+
+LOADED = '''\
+name: db.ip
+type: secondary
+files: /var/cache/named/db.ip
+serial: 2026101901
+nodes: 1234
+last loaded: Mon, 19 Oct 2026 10:00:00 GMT
+next refresh: Mon, 19 Oct 2026 14:00:00 GMT
+expires: Wed, 18 Nov 2026 10:00:00 GMT
+secure: no
+dynamic: no
+reconfigurable via modzone: no
+'''
+
+TRANSFER_LOG = '''\
+19-Oct-2026 09:00:00.000 xfer-in: info: transfer of 'db.ip/IN' from 129.187.208.46#53: \
+Transfer completed: 10 messages, 2000 records, 100000 bytes, 0.250 secs (400000 bytes/sec)
+19-Oct-2026 09:00:00.000 xfer-in: info: transfer of 'db.ip/IN' from 129.187.208.46#53: Transfer status: success
+19-Oct-2026 10:00:00.000 xfer-in: info: transfer of 'db.ip/IN' from 129.187.208.46#53: \
+Transfer completed: 12 messages, 3456 records, 123456 bytes, 0.532 secs (232060 bytes/sec)
+19-Oct-2026 10:00:01.000 xfer-in: info: transfer of 'malicious/IN' from 129.187.208.46#53: \
+Transfer completed: 1 messages, 5 records, 321 bytes, 0.001 secs (321000 bytes/sec) (serial 7)
+'''
+
+
+def fake_call(zonestatus_output, local_soa=None, master_soa=None):
+    def call(cmd):
+        if cmd.startswith("sudo rndc zonestatus"):
+            if zonestatus_output is None:
+                raise bash.CallError("rndc: 'zonestatus' failed: not found")
+            return zonestatus_output
+        soa = local_soa if "@" + zone_monitor.LOCAL_SERVER in cmd else master_soa
+        if soa is None:
+            raise bash.CallError(";; connection timed out; no servers could be reached")
+        return "localhost. named-mgr.example.com. {0} 14400 900 2592000 3600\n".format(soa)
+    return call
+
+
+BLOCK_CATEGORIES = {
+    "suspicious": 0,
+    "advertising": 1,
+    "tracking": 2,
+    "malicious": 3,
+    "bitcoin": 4
+}
+
+
+class SlaveZoneNamesTest(unittest.TestCase):
+    def test_combines_categories_and_maps_ip(self):
+        zone_names, critical_zone_names = zone_monitor.slave_zone_names(
+            ["advertising", "malicious", "ip"], ["ip"], BLOCK_CATEGORIES)
+        self.assertEqual(zone_names, ["db.ip", "db.combination.10"])
+        self.assertEqual(critical_zone_names, ["db.ip"])
+
+    def test_combination_is_critical_if_any_category_is(self):
+        _, critical_zone_names = zone_monitor.slave_zone_names(
+            ["advertising", "malicious", "ip"], ["malicious"], BLOCK_CATEGORIES)
+        self.assertEqual(critical_zone_names, ["db.combination.10"])
+
+    def test_warns_about_critical_zone_not_blocked(self):
+        with self.assertLogs(level="WARNING") as logs:
+            _, critical_zone_names = zone_monitor.slave_zone_names(["ip"], ["ip", "malicous"], BLOCK_CATEGORIES)
+        self.assertEqual(critical_zone_names, ["db.ip"])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("malicous", logs.output[0])
+
+
+class ZonestatusTest(unittest.TestCase):
+    def test_parses_key_value_lines(self):
+        with unittest.mock.patch.object(bash, "call", return_value=LOADED):
+            status = zone_monitor.zonestatus("db.ip")
+        self.assertEqual(status["serial"], "2026101901")
+        self.assertEqual(status["last loaded"], "Mon, 19 Oct 2026 10:00:00 GMT")
+        self.assertEqual(status["reconfigurable via modzone"], "no")
+
+    def test_empty_if_rndc_fails(self):
+        with unittest.mock.patch.object(bash, "call", side_effect=bash.CallError("not found")):
+            self.assertEqual(zone_monitor.zonestatus("db.ip"), {})
+
+
+DIG_HEADER = '''\
+; <<>> DiG 9.16.1 <<>> @127.0.0.1 . NS +norecurse
+;; global options: +cmd
+;; Got answer:
+;; ->>HEADER<<- opcode: QUERY, status: NOERROR, id: 4242
+;; flags: {0}; QUERY: 1, ANSWER: 13, AUTHORITY: 0, ADDITIONAL: 1
+'''
+
+
+class RecursionAvailableTest(unittest.TestCase):
+    def test_recursion_available(self):
+        with unittest.mock.patch.object(bash, "call", return_value=DIG_HEADER.format("qr ra")):
+            self.assertTrue(zone_monitor.recursion_available())
+
+    def test_recursion_disabled(self):
+        with unittest.mock.patch.object(bash, "call", return_value=DIG_HEADER.format("qr")):
+            self.assertFalse(zone_monitor.recursion_available())
+
+    def test_no_answer(self):
+        with unittest.mock.patch.object(bash, "call", side_effect=bash.CallError("connection refused")):
+            self.assertIsNone(zone_monitor.recursion_available())
+
+
+class LastTransfersTest(unittest.TestCase):
+    def test_keeps_last_completed_transfer_per_zone(self):
+        with unittest.mock.patch("os.path.isfile", return_value=True), \
+                unittest.mock.patch("builtins.open", unittest.mock.mock_open(read_data=TRANSFER_LOG)):
+            transfers = zone_monitor.last_transfers()
+        self.assertEqual(set(transfers), {"db.ip", "malicious"})
+        self.assertEqual(transfers["db.ip"].group("bytes"), "123456")
+        self.assertEqual(transfers["db.ip"].group("records"), "3456")
+        self.assertEqual(transfers["db.ip"].group("secs"), "0.532")
+        self.assertEqual(transfers["malicious"].group("bytes"), "321")
+
+
+class SerialLagTest(unittest.TestCase):
+    def lag(self, local, master):
+        status = zone_monitor.ZoneStatus("db.ip")
+        status.local_serial = local
+        status.master_serial = master
+        return status.serial_lag
+
+    def test_behind(self):
+        self.assertEqual(self.lag(5, 7), 2)
+
+    def test_ahead(self):
+        self.assertEqual(self.lag(7, 5), -2)
+
+    def test_wraps_around(self):
+        self.assertEqual(self.lag(2 ** 32 - 1, 1), 2)
+
+    def test_unknown_master(self):
+        self.assertIsNone(self.lag(5, None))
+
+
+class CheckTest(unittest.TestCase):
+    def check(self, call, master="129.187.208.46"):
+        with unittest.mock.patch.object(bash, "call", side_effect=call), \
+                unittest.mock.patch.object(zone_monitor, "last_transfers", return_value={}):
+            return zone_monitor.check(["db.ip"], master)[0]
+
+    def test_never_loaded_zone_is_not_loaded(self):
+        status = self.check(fake_call(NEVER_LOADED))
+        self.assertFalse(status.loaded)
+        self.assertTrue(status.stale)
+        self.assertIsNone(status.local_serial)
+        self.assertIsNone(status.last_loaded)
+
+    def test_missing_zone_is_not_loaded(self):
+        self.assertFalse(self.check(fake_call(None)).loaded)
+
+    def test_loaded_from_zonestatus(self):
+        status = self.check(fake_call(LOADED))
+        self.assertTrue(status.loaded)
+        self.assertEqual(status.local_serial, 2026101901)
+
+    def test_loaded_from_local_soa(self):
+        status = self.check(fake_call(None, local_soa=2026101901, master_soa=2026101903))
+        self.assertTrue(status.loaded)
+        self.assertEqual(status.serial_lag, 2)
+
+    def test_local_only_skips_master(self):
+        call = unittest.mock.Mock(side_effect=fake_call(LOADED, local_soa=1, master_soa=2))
+        with unittest.mock.patch.object(bash, "call", call), \
+                unittest.mock.patch.object(zone_monitor, "last_transfers") as last_transfers:
+            status = zone_monitor.check(["db.ip"])[0]
+        last_transfers.assert_not_called()
+        self.assertIsNone(status.master_serial)
+        self.assertFalse(any("129.187.208.46" in args[0] for args, _ in call.call_args_list))
+
+
+class StaleTest(unittest.TestCase):
+    def status(self, age, master_serial=None, expires_in=datetime.timedelta(days=30)):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        status = zone_monitor.ZoneStatus("db.ip")
+        status.loaded = True
+        status.local_serial = 5
+        status.master_serial = master_serial
+        status.last_loaded = now - age
+        status.expires = now + expires_in
+        return status
+
+    def test_fresh(self):
+        self.assertFalse(self.status(datetime.timedelta(hours=1), master_serial=7).stale)
+
+    def test_old_but_up_to_date(self):
+        self.assertFalse(self.status(datetime.timedelta(days=2), master_serial=5).stale)
+
+    def test_old_and_behind(self):
+        self.assertTrue(self.status(datetime.timedelta(days=2), master_serial=7).stale)
+
+    def test_old_and_master_unreachable(self):
+        self.assertTrue(self.status(datetime.timedelta(days=2)).stale)
+
+    def test_expiring(self):
+        status = self.status(datetime.timedelta(hours=1), master_serial=5, expires_in=datetime.timedelta(hours=1))
+        self.assertTrue(status.expiring)
+        self.assertTrue(status.stale)
+
+
+class AlertTest(unittest.TestCase):
+    def status(self, master_serial):
+        status = zone_monitor.ZoneStatus("db.ip")
+        status.loaded = True
+        status.local_serial = 5
+        status.master_serial = master_serial
+        status.last_loaded = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=2)
+        return status
+
+    def test_master_unreachable(self):
+        with self.assertLogs(level="WARNING") as logs:
+            zone_monitor.alert([self.status(None)])
+        self.assertIn("master is unreachable", logs.output[0])
+        self.assertNotIn("None", logs.output[0])
+
+    def test_behind_master(self):
+        with self.assertLogs(level="WARNING") as logs:
+            zone_monitor.alert([self.status(7)])
+        self.assertIn("serial 5 is 2 behind master", logs.output[0])
+
+    def test_not_loaded(self):
+        with self.assertLogs(level="ERROR") as logs:
+            zone_monitor.alert([zone_monitor.ZoneStatus("db.ip")])
+        self.assertIn("not loaded", logs.output[0])
+
+
+class ToMetricsTest(unittest.TestCase):
+    def test_formats_known_values(self):
+        status = zone_monitor.ZoneStatus("db.ip")
+        status.loaded = True
+        status.local_serial = 5
+        status.master_serial = 7
+        status.last_loaded = datetime.datetime(2026, 10, 19, 10, tzinfo=datetime.timezone.utc)
+        status.expires = datetime.datetime(2126, 10, 19, 10, tzinfo=datetime.timezone.utc)
+        status.transfer_duration = 0.532
+        status.transfer_bytes = 123456
+        lines = zone_monitor.to_metrics([status]).splitlines()
+        self.assertIn('dns_fw_zone_loaded{zone="db.ip"} 1', lines)
+        self.assertIn('dns_fw_zone_stale{zone="db.ip"} 0', lines)
+        self.assertIn('dns_fw_zone_serial{zone="db.ip",source="local"} 5', lines)
+        self.assertIn('dns_fw_zone_serial{zone="db.ip",source="master"} 7', lines)
+        self.assertIn('dns_fw_zone_serial_lag{zone="db.ip"} 2', lines)
+        self.assertIn('dns_fw_zone_transfer_duration_seconds{zone="db.ip"} 0.532', lines)
+        self.assertIn('dns_fw_zone_transfer_bytes{zone="db.ip"} 123456', lines)
+
+    def test_omits_unknown_values(self):
+        metrics = zone_monitor.to_metrics([zone_monitor.ZoneStatus("db.ip")])
+        self.assertIn('dns_fw_zone_loaded{zone="db.ip"} 0', metrics)
+        self.assertNotIn("dns_fw_zone_serial{", metrics)
+        self.assertNotIn("dns_fw_zone_transfer_bytes{", metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
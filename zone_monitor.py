@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+import concurrent.futures
+import datetime
+import email.utils
+import json
+import logging
+import os.path
+import re
+import time
+import typing
+
+import bash
+
+LOCAL_SERVER = "127.0.0.1"
+ZONE_TRANSFERS_LOG = "/var/log/named/zone_transfers"
+
+STALE_AFTER = datetime.timedelta(hours=12)
+EXPIRY_MARGIN = datetime.timedelta(hours=4)
+POLL_INTERVAL = 5
+MAX_WORKERS = 16
+
+TRANSFER_COMPLETED = re.compile(
+    r"transfer of '(?P<zone>[^/']+)/IN' from \S+: Transfer completed: "
+    r"(?P<messages>\d+) messages, (?P<records>\d+) records, (?P<bytes>\d+) bytes, (?P<secs>[\d.]+) secs"
+)
+
+METRICS_HEADER = '''\
+# HELP dns_fw_zone_loaded Whether the slave zone is loaded by BIND9.
+# TYPE dns_fw_zone_loaded gauge
+# HELP dns_fw_zone_serial SOA serial of the slave zone, by source.
+# TYPE dns_fw_zone_serial gauge
+# HELP dns_fw_zone_serial_lag Number of serials the local zone is behind the master.
+# TYPE dns_fw_zone_serial_lag gauge
+# HELP dns_fw_zone_last_loaded_seconds Unix time of the last successful load of the zone.
+# TYPE dns_fw_zone_last_loaded_seconds gauge
+# HELP dns_fw_zone_transfer_duration_seconds Duration of the last completed transfer of the zone.
+# TYPE dns_fw_zone_transfer_duration_seconds gauge
+# HELP dns_fw_zone_transfer_bytes Size of the last completed transfer of the zone.
+# TYPE dns_fw_zone_transfer_bytes gauge
+# HELP dns_fw_zone_stale Whether the zone is considered stale.
+# TYPE dns_fw_zone_stale gauge
+# HELP dns_fw_zone_expires_seconds Unix time at which the zone expires if it isn't refreshed.
+# TYPE dns_fw_zone_expires_seconds gauge
+'''
+
+
+class ZoneStatus:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.loaded: bool = False
+        self.local_serial: typing.Optional[int] = None
+        self.master_serial: typing.Optional[int] = None
+        self.last_loaded: typing.Optional[datetime.datetime] = None
+        self.next_refresh: typing.Optional[datetime.datetime] = None
+        self.expires: typing.Optional[datetime.datetime] = None
+        self.transfer_duration: typing.Optional[float] = None
+        self.transfer_bytes: typing.Optional[int] = None
+        self.transfer_records: typing.Optional[int] = None
+
+    @property
+    def serial_lag(self) -> typing.Optional[int]:
+        """Serials the local copy is behind the master, using RFC 1982 serial number arithmetic."""
+        if self.local_serial is None or self.master_serial is None:
+            return None
+        lag = (self.master_serial - self.local_serial) % 2 ** 32
+        return lag if lag < 2 ** 31 else lag - 2 ** 32
+
+    @property
+    def age(self) -> typing.Optional[datetime.timedelta]:
+        if self.last_loaded is None:
+            return None
+        return datetime.datetime.now(datetime.timezone.utc) - self.last_loaded
+
+    @property
+    def expiring(self) -> bool:
+        """A zone is expiring if BIND9 will drop it before the next regular refresh could happen."""
+        if self.expires is None:
+            return False
+        return self.expires - datetime.datetime.now(datetime.timezone.utc) < EXPIRY_MARGIN
+
+    @property
+    def stale(self) -> bool:
+        """A zone is stale if it is not loaded, expiring, or wasn't refreshed for too long while it lags behind
+        the master or the master can't be reached."""
+        if not self.loaded or self.expiring:
+            return True
+        lag = self.serial_lag
+        age = self.age
+        return age is not None and age > STALE_AFTER and (lag is None or lag > 0)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "loaded": self.loaded,
+            "stale": self.stale,
+            "local_serial": self.local_serial,
+            "master_serial": self.master_serial,
+            "serial_lag": self.serial_lag,
+            "last_loaded": _isoformat(self.last_loaded),
+            "age_seconds": self.age.total_seconds() if self.age is not None else None,
+            "next_refresh": _isoformat(self.next_refresh),
+            "expires": _isoformat(self.expires),
+            "expiring": self.expiring,
+            "transfer_duration_seconds": self.transfer_duration,
+            "transfer_bytes": self.transfer_bytes,
+            "transfer_records": self.transfer_records,
+        }
+
+
+def slave_zone_names(block_zones: list, critical_zones: list, block_categories: dict) -> tuple:
+    """Returns the names of all slave blocking zones and of those among them which are critical.
+    Block categories are served combined in a single zone, which is critical if any of its categories is."""
+    zone_names = []
+    critical_zone_names = []
+    combination_number = 0
+    combination_critical = False
+    for entry in block_zones:
+        if entry in block_categories:
+            combination_number = combination_number + 2 ** block_categories[entry]
+            combination_critical = combination_critical or entry in critical_zones
+        else:
+            name = "db.ip" if entry == "ip" else entry
+            zone_names.append(name)
+            if entry in critical_zones:
+                critical_zone_names.append(name)
+
+    if combination_number > 0:
+        zone_names.append("db.combination.{0}".format(combination_number))
+        if combination_critical:
+            critical_zone_names.append(zone_names[-1])
+
+    for entry in critical_zones:
+        if entry not in block_zones:
+            logging.warning("Critical zone {0} is not in block_zones and will not be waited for.".format(entry))
+
+    return zone_names, critical_zone_names
+
+
+def soa_serial(zone: str, server: str) -> typing.Optional[int]:
+    """Queries the given server for the SOA serial of the zone, returns None if it has no answer."""
+    try:
+        output = bash.call("dig @{0} {1} SOA +short +norecurse +time=2 +tries=1".format(server, zone))
+    except bash.CallError as error:
+        logging.debug("SOA query for {0} at {1} failed: {2}".format(zone, server, error))
+        return None
+    fields = output.split()
+    if len(fields) < 3 or not fields[2].isdigit():
+        return None
+    return int(fields[2])
+
+
+def recursion_available(server: str = LOCAL_SERVER) -> typing.Optional[bool]:
+    """Returns whether the server offers recursion, from the RA flag of its answer; None if it doesn't answer."""
+    try:
+        output = bash.call("dig @{0} . NS +norecurse +time=2 +tries=1".format(server))
+    except bash.CallError as error:
+        logging.debug("Query for recursion at {0} failed: {1}".format(server, error))
+        return None
+    for line in output.splitlines():
+        if line.startswith(";; flags:"):
+            return "ra" in line.split(";")[2].split(":")[1].split()
+    return None
+
+
+def zonestatus(zone: str) -> dict:
+    """Returns the output of 'rndc zonestatus' as dict, empty if the zone is not loaded."""
+    try:
+        output = bash.call("sudo rndc zonestatus {0}".format(zone))
+    except bash.CallError as error:
+        logging.debug("rndc zonestatus for {0} failed: {1}".format(zone, error))
+        return {}
+    status = {}
+    for line in output.splitlines():
+        key, separator, value = line.partition(":")
+        if separator:
+            status[key.strip()] = value.strip()
+    return status
+
+
+def last_transfers(filename: str = ZONE_TRANSFERS_LOG) -> dict:
+    """Returns the last completed transfer of each zone found in the BIND9 transfer log."""
+    transfers = {}
+    if not os.path.isfile(filename):
+        return transfers
+    with open(filename) as file:
+        for line in file:
+            match = TRANSFER_COMPLETED.search(line)
+            if match is not None:
+                transfers[match.group("zone")] = match
+    return transfers
+
+
+def check(zones: list, master: typing.Optional[str] = None) -> list:
+    """Queries local serials and zone status of all zones concurrently.
+    If a master is given, its serials and the last transfers are collected as well."""
+    statuses = [ZoneStatus(zone) for zone in zones]
+    if len(statuses) == 0:
+        return statuses
+    transfers = last_transfers() if master is not None else {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_WORKERS, 3 * len(statuses))) as executor:
+        futures = [(status,
+                    executor.submit(soa_serial, status.name, LOCAL_SERVER),
+                    executor.submit(soa_serial, status.name, master) if master is not None else None,
+                    executor.submit(zonestatus, status.name))
+                   for status in statuses]
+        for status, local_future, master_future, zonestatus_future in futures:
+            status.local_serial = local_future.result()
+            if master_future is not None:
+                status.master_serial = master_future.result()
+            info = zonestatus_future.result()
+            status.last_loaded = _parse_date(info.get("last loaded"))
+            status.next_refresh = _parse_date(info.get("next refresh"))
+            status.expires = _parse_date(info.get("expires"))
+
+            # BIND9 reports serial 0 and a load time at the epoch for secondary zones that never loaded
+            zonestatus_serial = int(info["serial"]) if info.get("serial", "").isdigit() else 0
+            if status.last_loaded is not None and status.last_loaded.timestamp() <= 0:
+                status.last_loaded = None
+            status.loaded = status.local_serial is not None or \
+                (zonestatus_serial != 0 and status.last_loaded is not None)
+            if status.local_serial is None and status.loaded:
+                status.local_serial = zonestatus_serial
+
+            transfer = transfers.get(status.name)
+            if transfer is not None:
+                status.transfer_duration = float(transfer.group("secs"))
+                status.transfer_bytes = int(transfer.group("bytes"))
+                status.transfer_records = int(transfer.group("records"))
+    return statuses
+
+
+def alert(statuses: list) -> None:
+    """Logs every zone that is not loaded or stale."""
+    for status in statuses:
+        if not status.loaded:
+            logging.error("Zone {0} is not loaded, its domains are not being blocked.".format(status.name))
+        elif status.expiring:
+            logging.error("Zone {0} expires at {1} and will stop blocking if it isn't refreshed.".format(
+                status.name, _isoformat(status.expires)))
+        elif status.stale and status.master_serial is None:
+            logging.warning("Zone {0} is stale: master is unreachable, serial {1} last loaded {2}.".format(
+                status.name, status.local_serial, _isoformat(status.last_loaded)))
+        elif status.stale:
+            logging.warning("Zone {0} is stale: serial {1} is {2} behind master, last loaded {3}.".format(
+                status.name, status.local_serial, status.serial_lag, _isoformat(status.last_loaded)))
+
+
+def wait_until_loaded(zones: list, timeout: float) -> bool:
+    """Blocks until all given zones are loaded, returns False if they aren't after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while True:
+        missing = [status.name for status in check(zones) if not status.loaded]
+        if len(missing) == 0:
+            return True
+        if time.monotonic() >= deadline:
+            logging.error("Zones not loaded after {0} seconds: {1}".format(timeout, ", ".join(missing)))
+            return False
+        logging.info("Waiting for zones to load: {0}".format(", ".join(missing)))
+        time.sleep(POLL_INTERVAL)
+
+
+def to_json(statuses: list) -> str:
+    return json.dumps([status.to_dict() for status in statuses], indent=2)
+
+
+def to_metrics(statuses: list) -> str:
+    """Formats the statuses in the Prometheus text exposition format."""
+    lines = []
+    for status in statuses:
+        label = 'zone="{0}"'.format(status.name)
+        lines.append("dns_fw_zone_loaded{{{0}}} {1}".format(label, int(status.loaded)))
+        lines.append("dns_fw_zone_stale{{{0}}} {1}".format(label, int(status.stale)))
+        for source, serial in (("local", status.local_serial), ("master", status.master_serial)):
+            if serial is not None:
+                lines.append('dns_fw_zone_serial{{{0},source="{1}"}} {2}'.format(label, source, serial))
+        if status.serial_lag is not None:
+            lines.append("dns_fw_zone_serial_lag{{{0}}} {1}".format(label, status.serial_lag))
+        if status.last_loaded is not None:
+            lines.append("dns_fw_zone_last_loaded_seconds{{{0}}} {1}".format(label, status.last_loaded.timestamp()))
+        if status.expires is not None:
+            lines.append("dns_fw_zone_expires_seconds{{{0}}} {1}".format(label, status.expires.timestamp()))
+        if status.transfer_duration is not None:
+            lines.append("dns_fw_zone_transfer_duration_seconds{{{0}}} {1}".format(label, status.transfer_duration))
+        if status.transfer_bytes is not None:
+            lines.append("dns_fw_zone_transfer_bytes{{{0}}} {1}".format(label, status.transfer_bytes))
+    return METRICS_HEADER + "\n".join(lines) + "\n"
+
+
+def _parse_date(value: typing.Optional[str]) -> typing.Optional[datetime.datetime]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _isoformat(value: typing.Optional[datetime.datetime]) -> typing.Optional[str]:
+    return value.isoformat() if value is not None else None